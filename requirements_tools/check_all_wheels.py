@@ -9,8 +9,7 @@ import subprocess
 
 
 def silent(*cmd: str) -> None:
-    with open(os.devnull, 'w') as devnull:
-        subprocess.check_call(cmd, stdout=devnull)
+    subprocess.check_call(cmd, stdout=subprocess.DEVNULL)
 
 
 DISTS_DIR = 'downloaded_dists'
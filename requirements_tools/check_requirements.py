@@ -1,10 +1,14 @@
 from __future__ import annotations
 
+import collections
+import functools
 import itertools
 import os.path
 import sys
 from operator import attrgetter
 from typing import Iterable
+from typing import NamedTuple
+from typing import Sequence
 
 import pkg_resources
 import pytest
@@ -16,6 +20,46 @@ installed_things = {
     for pkg in pkg_resources.working_set
 }
 REQUIREMENTS_FILES = frozenset(('requirements.txt', 'requirements-dev.txt'))
+ALL_REQUIREMENTS_FILES = (
+    'requirements-minimal.txt',
+    'requirements.txt',
+    'requirements-dev-minimal.txt',
+    'requirements-dev.txt',
+)
+
+
+class Req(NamedTuple):
+    """A normalized requirement, cheap to hash and compare.
+
+    Used in place of `Requirement` where we only do set arithmetic, since
+    `Requirement` objects drag their whole parse tree around with them.
+    `version` is the pinned version from `pkg_resources.parse_version`, so
+    that `==1.0` matches `==1.0.0` as it does for a `Requirement`.
+    """
+    key: str
+    extras: tuple[str, ...]
+    version: object | None
+
+    def __str__(self) -> str:
+        extras = '[{}]'.format(','.join(self.extras)) if self.extras else ''
+        version = f'=={self.version}' if self.version is not None else ''
+        return f'{self.key}{extras}{version}'
+
+
+class Unpinned(NamedTuple):
+    """A package which should be pinned, and which requirement needs it."""
+    name: str
+    required_by: Requirement
+    filename: str
+
+
+@functools.lru_cache(maxsize=None)
+def _requires(key: str, extras: tuple[str, ...]) -> tuple[Requirement, ...]:
+    """Cached `Distribution.requires`, which reparses metadata every call.
+
+    `extras` should be sorted so equivalent requests share a cache entry.
+    """
+    return tuple(installed_things[key].requires(extras))
 
 
 def parse_requirement(req: str) -> Requirement:
@@ -23,25 +67,60 @@ def parse_requirement(req: str) -> Requirement:
     Parses requirement specifier, normalizing any versions and stripping
     environment metadata for ease of comparison.
     """
-    dumb_parse = Requirement.parse(req)
+    return _normalize(Requirement.parse(req), req)
+
+
+def _normalize(dumb_parse: Requirement, req: str) -> Requirement:
+    """Normalizes `dumb_parse`, which was parsed from `req`."""
     if dumb_parse.extras:
         extras = '[{}]'.format(','.join(dumb_parse.extras))
     else:
         extras = ''
-    return Requirement.parse(
-        dumb_parse.project_name + extras + ','.join(
-            operator + pkg_resources.safe_version(version)
-            for operator, version in dumb_parse.specs
-        ),
+    normalized = dumb_parse.project_name + extras + ','.join(
+        operator + pkg_resources.safe_version(version)
+        for operator, version in dumb_parse.specs
+    )
+    # usually the line was already normalized (as in a pinned
+    # requirements.txt), in which case reparsing would give the same thing
+    if normalized == req:
+        return dumb_parse
+    else:
+        return Requirement.parse(normalized)
+
+
+def _existing_files(filenames: Iterable[str]) -> frozenset[str]:
+    """Stats each of `filenames` once, returning the ones which exist."""
+    return frozenset(
+        filename for filename in filenames if os.path.exists(filename)
     )
 
 
+def _requirement_lines(contents: str) -> list[str]:
+    """Returns the non-blank, non-comment lines of a requirements file."""
+    return [
+        line.strip() for line in contents.splitlines()
+        if line.strip() and not line.startswith('#')
+    ]
+
+
 def get_lines_from_file(filename: str) -> list[str]:
     with open(filename) as requirements_file:
-        return [
-            line.strip() for line in requirements_file
-            if line.strip() and not line.startswith('#')
-        ]
+        return _requirement_lines(requirements_file.read())
+
+
+@functools.lru_cache(maxsize=1024)
+def _parse_requirement_line(line: str) -> Requirement | None:
+    """Parses a requirements file line, or None if its environment marker
+    excludes it from this environment.
+    """
+    # this parses the environment marker, but doesn't normalize the
+    # version, hence why we normalize it below
+    raw_requirement = Requirement.parse(line)
+    # skip this requirement if it isn't supposed to be installed in
+    # this environment
+    if raw_requirement.marker and not raw_requirement.marker.evaluate():
+        return None
+    return _normalize(raw_requirement, line)
 
 
 def get_raw_requirements(filename: str) -> list[tuple[Requirement, str]]:
@@ -59,18 +138,7 @@ def get_raw_requirements(filename: str) -> list[tuple[Requirement, str]]:
         if line.strip() == '-e .':
             continue
         try:
-            # this parses the environment marker, but doesn't normalize the
-            # version, hence why we reparse with our custom function below
-            raw_requirement = Requirement.parse(line)
-            # skip this requirement if it isn't supposed to be installed in
-            # this environment
-            if (
-                raw_requirement.marker
-                and not raw_requirement.marker.evaluate()
-            ):
-                continue
-
-            ret.append((parse_requirement(line), filename))
+            requirement = _parse_requirement_line(line)
         except ValueError as e:
             raise AssertionError(
                 'Requirements must be <<pkg>> or <<pkg>>==<<version>>\n'
@@ -79,6 +147,8 @@ def get_raw_requirements(filename: str) -> list[tuple[Requirement, str]]:
                 ' - line of error: {}\n'
                 ' - inner exception: {!r}\n'.format(line.strip(), e),
             )
+        if requirement is not None:
+            ret.append((requirement, filename))
     return ret
 
 
@@ -87,11 +157,34 @@ def to_version(requirement: Requirement) -> str | None:
 
     Returns None if no single version is pinned.
     """
-    if len(requirement.specs) != 1:
+    specs = requirement.specs
+    if len(specs) != 1:
         return None
-    if requirement.specs[0][0] != '==':
+    operator, version = specs[0]
+    if operator != '==':
         return None
-    return requirement.specs[0][1]
+    return version
+
+
+def _parse_version(version: str) -> object:
+    try:
+        return pkg_resources.parse_version(version)
+    except ValueError:  # e.g. `1.0.*`, which can only match as written
+        return version
+
+
+def to_req(requirement: Requirement) -> Req:
+    version = to_version(requirement)
+    return Req(
+        requirement.key,
+        tuple(sorted(requirement.extras)),
+        None if version is None else _parse_version(version),
+    )
+
+
+def installed_req(key: str) -> Req:
+    """Returns the pinned `Req` for the installed version of `key`."""
+    return Req(key, (), _parse_version(installed_things[key].version))
 
 
 def to_equality_str(requirement: Requirement) -> str:
@@ -106,47 +199,46 @@ def to_pinned_versions(
 
 def find_unpinned_requirements(
         requirements: Iterable[tuple[Requirement, str]],
-) -> set[tuple[str, Requirement, str]]:
+) -> frozenset[Unpinned]:
     """
     :param requirements: list of (requirement, filename)
-    :return: Unpinned packages: list of
-        (package_name, requiring_package, filename)
+    :return: Unpinned packages
     """
     pinned_versions = to_pinned_versions(requirements)
 
     unpinned = {
         # unpinned packages already listed in requirements.txt
-        (requirement.key, requirement, filename)
+        Unpinned(requirement.key, requirement, filename)
         for requirement, filename in requirements
         if not pinned_versions[requirement.key]
     }
 
     # unpinned packages which are needed but not listed in requirements.txt
     for requirement, filename in requirements:
-        package_info = installed_things[requirement.key]
-
-        for sub_requirement in package_info.requires(requirement.extras):
+        for sub_requirement in _requires(
+                requirement.key, tuple(sorted(requirement.extras)),
+        ):
             if sub_requirement.key not in pinned_versions:
                 unpinned.add(
-                    (sub_requirement.key, requirement, filename),
+                    Unpinned(sub_requirement.key, requirement, filename),
                 )
 
-    return unpinned
+    return frozenset(unpinned)
+
+
+def _unpinned_sort_key(unpinned: Unpinned) -> tuple[str, str, str]:
+    return unpinned.name, str(unpinned.required_by), unpinned.filename
 
 
 def format_unpinned_requirements(
-        unpinned_requirements: set[tuple[str, Requirement, str]],
+        unpinned_requirements: Iterable[Unpinned],
 ) -> str:
-    return '\t' + '\n\t'.join(
-        '{} (required by {} in {})\n\t\tmaybe you want "{}"?'.format(
-            package,
-            requirement,
-            filename,
-            f'{package}=={installed_things[package].version}',
-        )
+    return '\n'.join(
+        f'\t{package} (required by {requirement} in {filename})\n'
+        f'\t\tmaybe you want "{package}=={installed_things[package].version}"?'
         for package, requirement, filename in sorted(
             unpinned_requirements,
-            key=str,
+            key=_unpinned_sort_key,
         )
     )
 
@@ -175,19 +267,18 @@ def _get_all_raw_requirements(
     # for compatibility with repos that haven't started using
     # requirements-dev-minimal.txt, we don't want to force pinning
     # requirements-dev.txt until they use minimal
-    if not os.path.exists('requirements-dev-minimal.txt'):
+    existing = _existing_files(
+        requirements_files | {'requirements-dev-minimal.txt'},
+    )
+    if 'requirements-dev-minimal.txt' not in existing:
         requirements_files -= {'requirements-dev.txt'}
 
-    if all(
-            not os.path.exists(reqfile)
-            for reqfile in requirements_files
-    ):  # pragma: no cover
+    requirements_files &= existing
+    if not requirements_files:  # pragma: no cover
         return None
     return list(
         itertools.chain.from_iterable([
-            get_raw_requirements(reqfile)
-            for reqfile in requirements_files
-            if os.path.exists(reqfile)
+            get_raw_requirements(reqfile) for reqfile in requirements_files
         ]),
     )
 
@@ -211,10 +302,10 @@ def _check_requirements_integrity_impl() -> None:
                     req.key, filename,
                 ),
             )
-        installed_version = to_version(
-            parse_requirement(
-                f'{req.key}=={installed_things[req.key].version}',
-            ),
+        # normalize the same way `parse_requirement` does, without paying for
+        # a full requirement parse just to read the version back out
+        installed_version = pkg_resources.safe_version(
+            installed_things[req.key].version,
         )
         if installed_version != version:
             incorrect.append((filename, req.key, version, installed_version))
@@ -240,13 +331,9 @@ def check_requirements_integrity() -> None:  # pragma: no cover
 
 def test_no_duplicate_requirements() -> None:
     duplicates = []
-    for filename in (
-        'requirements-minimal.txt',
-        'requirements.txt',
-        'requirements-dev-minimal.txt',
-        'requirements-dev.txt',
-    ):
-        if not os.path.exists(filename):
+    existing = _existing_files(ALL_REQUIREMENTS_FILES)
+    for filename in ALL_REQUIREMENTS_FILES:
+        if filename not in existing:
             continue
         found = set()
         for req, _ in get_raw_requirements(filename):
@@ -282,42 +369,99 @@ def test_requirements_pinned() -> None:
         )
 
 
-def get_pinned_versions_from_requirement(
-        requirement: Requirement,
-) -> set[str]:
-    expected_pinned = set()
-    requirements_to_parse = [requirement]
-    already_parsed = {(requirement.key, requirement.extras)}
-    while requirements_to_parse:
-        req = requirements_to_parse.pop()
-        installed_req = installed_things[req.key]
-        for sub_requirement in installed_req.requires(req.extras):
-            key = (sub_requirement.key, sub_requirement.extras)
-            if key not in already_parsed:
-                requirements_to_parse.append(sub_requirement)
-                already_parsed.add(key)
-            try:
-                installed = installed_things[sub_requirement.key]
-            except KeyError:
-                raise AssertionError(
+def _walk_dependencies(
+        roots: Iterable[tuple[Requirement, int]],
+) -> tuple[dict[str, int], dict[int, str]]:
+    """Walks the dependencies of several requirements in a single pass.
+
+    Each of `roots` is tagged with a bitmask of the sources it came from.
+    Returns, for every package depended on, the bitmask of the sources which
+    (transitively) depend on it, along with an unmet dependency error for
+    each source (by bit index) which has one.
+
+    A requirement is walked at most once per source.  Requirements waiting
+    to be walked pick up the bits of any other source which reaches them in
+    the meantime, so dependencies shared between sources are mostly walked
+    just once.
+    """
+    reached: dict[str, int] = {}
+    unmet: dict[int, str] = {}
+    # requirement => the sources which have walked (or queued) it; most
+    # dependencies don't ask for extras, and those are keyed by name alone
+    walked: dict[str | tuple[str, tuple[str, ...]], int] = {}
+    pending: dict[str | tuple[str, tuple[str, ...]], int] = {}
+    to_walk: collections.deque[
+        tuple[Requirement, tuple[str, ...], str | tuple[str, tuple[str, ...]]]
+    ] = collections.deque()
+
+    def push(req: Requirement, mask: int) -> None:
+        extras = tuple(sorted(req.extras)) if req.extras else ()
+        ident = (req.key, extras) if extras else req.key
+        seen = walked.get(ident, 0)
+        new = mask & ~seen
+        if not new:
+            return
+        walked[ident] = seen | new
+        if ident in pending:
+            pending[ident] |= new
+        else:
+            pending[ident] = new
+            to_walk.append((req, extras, ident))
+
+    for req, mask in roots:
+        push(req, mask)
+    while to_walk:
+        req, extras, ident = to_walk.popleft()
+        mask = pending.pop(ident)
+        for sub_requirement in _requires(req.key, extras):
+            sub_key = sub_requirement.key
+            if sub_key not in installed_things:
+                source = (mask & -mask).bit_length() - 1
+                unmet.setdefault(
+                    source,
                     'Unmet dependency detected!\n'
                     'Somehow `{}` is not installed!\n'
                     '  (from {})\n'
                     'Are you suffering from '
                     'https://github.com/pypa/pip/issues/3903?'.format(
-                        sub_requirement.key,
+                        sub_key,
                         '{}[{}]'.format(req.key, ','.join(req.extras))
                         if req.extras else req.key,
                     ),
                 )
-            expected_pinned.add(
-                f'{installed.key}=={installed.version}',
-            )
-    return expected_pinned
+                continue
+            reached[sub_key] = reached.get(sub_key, 0) | mask
+            push(sub_requirement, mask)
+    return reached, unmet
+
+
+def get_pinned_versions_from_requirement(
+        requirement: Requirement,
+) -> frozenset[str]:
+    """Returns the `name==version` pins of everything `requirement` needs.
+
+    The result is cached, so it is frozen to keep callers from mutating it.
+    """
+    return _pinned_versions(requirement.key, tuple(sorted(requirement.extras)))
+
+
+@functools.lru_cache(maxsize=None)
+def _pinned_versions(key: str, extras: tuple[str, ...]) -> frozenset[str]:
+    """Cached by key and extras only, as the version specifiers of the
+    requirement don't change which dependencies are installed.
+    """
+    extras_str = '[{}]'.format(','.join(extras)) if extras else ''
+    requirement = Requirement.parse(key + extras_str)
+    reached, unmet = _walk_dependencies([(requirement, 1)])
+    if unmet:
+        raise AssertionError(unmet[0])
+    return frozenset(
+        f'{dep}=={installed_things[dep].version}' for dep in reached
+    )
 
 
 def format_versions_on_lines_with_dashes(
-    versions: Iterable[Requirement],
+    versions: Iterable[Req | Requirement],
 ) -> str:
     return '\n'.join(
         f'\t- {req}'
@@ -325,57 +469,74 @@ def format_versions_on_lines_with_dashes(
     )
 
 
-def _expected_pinned(filename: str, pin_filename: str) -> set[str]:
-    ret = set()
-    for req, _ in get_raw_requirements(filename):
-        if req.key not in installed_things:
-            raise AssertionError(
-                'A dependency listed in {} is not installed.\n'
-                'Is it missing from {}?\n'
-                '\t- {}\n'.format(filename, pin_filename, req.key),
-            )
-        ret.add(f'{req.key}=={installed_things[req.key].version}')
-        ret |= get_pinned_versions_from_requirement(req)
-    return ret
+def _expected_pinned_multi(
+        environments: Sequence[tuple[str, str]],
+) -> list[set[Req]]:
+    """Computes the expected pins for several minimal requirements files.
+
+    `environments` is a sequence of `(minimal_filename, pin_filename)`.  Each
+    file gets a bit, and all of the top-level requirements are walked
+    together so dependencies shared between files (typically prod and dev)
+    are mostly only walked once.
+    """
+    roots = []
+    top_level: dict[str, int] = {}
+    # file index => its first error; each file's own requirements are
+    # checked before what they depend on, and earlier files come first
+    errors: dict[int, str] = {}
+    for i, (filename, pin_filename) in enumerate(environments):
+        for req, _ in get_raw_requirements(filename):
+            if req.key not in installed_things:
+                errors[i] = (
+                    'A dependency listed in {} is not installed.\n'
+                    'Is it missing from {}?\n'
+                    '\t- {}\n'.format(filename, pin_filename, req.key)
+                )
+                break
+            roots.append((req, 1 << i))
+            top_level[req.key] = top_level.get(req.key, 0) | 1 << i
+        if 0 in errors:
+            raise AssertionError(errors[0])
+
+    reached, unmet = _walk_dependencies(roots)
+    for i, error in unmet.items():
+        errors.setdefault(i, error)
+    if errors:
+        raise AssertionError(errors[min(errors)])
+    for key, mask in top_level.items():
+        reached[key] = reached.get(key, 0) | mask
+
+    return [
+        {
+            installed_req(key)
+            for key, mask in reached.items()
+            if mask & (1 << i)
+        }
+        for i in range(len(environments))
+    ]
 
 
 def test_top_level_dependencies() -> None:
     """Test that top-level requirements (reqs-minimal and reqs-dev-minimal)
     are consistent with the pinned requirements.
     """
-    if all(
-            not os.path.exists(path) for path in (
-                'requirements-minimal.txt',
-                'requirements.txt',
-                'requirements-dev-minimal.txt',
-                'requirements-dev.txt',
-            )
-    ):  # pragma: no cover
+    existing = _existing_files(ALL_REQUIREMENTS_FILES)
+    if not existing:  # pragma: no cover
         pytest.skip('No requirements files')
 
-    expected_pinned_prod = _expected_pinned(
-        'requirements-minimal.txt', 'requirements.txt',
-    )
-    environments = [
-        (
-            expected_pinned_prod,
-            'requirements.txt',
-            'requirements-minimal.txt',
-        ),
-    ]
-
-    if os.path.exists('requirements-dev-minimal.txt'):
-        expected_pinned_dev = _expected_pinned(
-            'requirements-dev-minimal.txt', 'requirements-dev.txt',
+    environments = [('requirements-minimal.txt', 'requirements.txt')]
+    check_dev = 'requirements-dev-minimal.txt' in existing
+    if check_dev:
+        environments.append(
+            ('requirements-dev-minimal.txt', 'requirements-dev.txt'),
         )
+
+    expected = _expected_pinned_multi(environments)
+
+    if check_dev:
         # if there are overlapping prod/dev deps, only list in prod
         # requirements
-        expected_pinned_dev -= expected_pinned_prod
-        environments.append((
-            expected_pinned_dev,
-            'requirements-dev.txt',
-            'requirements-dev-minimal.txt',
-        ))
+        expected[1] -= expected[0]
     else:
         print(
             '\033[93;1m'
@@ -389,17 +550,22 @@ def test_top_level_dependencies() -> None:
             '\033[0m',
         )
 
-    for expected_pinned_str, pin_filename, minimal_filename in environments:
-        expected_pinned = {parse_requirement(s) for s in expected_pinned_str}
-        if os.path.exists(pin_filename):
+    for expected_pinned, (minimal_filename, pin_filename) in zip(
+            expected, environments,
+    ):
+        if pin_filename in existing:
             requirements = {
                 req for req, _ in get_raw_requirements(pin_filename)
             }
         else:
             requirements = set()
 
-        pinned_but_not_required = requirements - expected_pinned
-        required_but_not_pinned = expected_pinned - requirements
+        # compare on the normalized `Req`, but report what was written
+        pinned = {to_req(req) for req in requirements}
+        pinned_but_not_required = {
+            req for req in requirements if to_req(req) not in expected_pinned
+        }
+        required_but_not_pinned = expected_pinned - pinned
 
         if pinned_but_not_required:
             raise AssertionError(
@@ -435,16 +601,19 @@ def test_top_level_dependencies() -> None:
 def test_no_underscores_all_dashes(
     requirements_files: Iterable[str] = REQUIREMENTS_FILES,
 ) -> None:
-    if all(
-            not os.path.exists(reqfile)
-            for reqfile in requirements_files
-    ):  # pragma: no cover
+    existing = _existing_files(requirements_files)
+    if not existing:  # pragma: no cover
         pytest.skip('No requirements files found')
 
     for requirement_file in requirements_files:
-        if not os.path.exists(requirement_file):
+        if requirement_file not in existing:
+            continue
+        with open(requirement_file) as f:
+            contents = f.read()
+        # the usual case: no underscores anywhere, so no lines to check
+        if '_' not in contents:
             continue
-        for line in get_lines_from_file(requirement_file):
+        for line in _requirement_lines(contents):
             # ignore the markers for underscore check
             if '_' in line.split(';')[0]:
                 raise AssertionError(
@@ -2,7 +2,9 @@
 from __future__ import annotations
 
 import argparse
+import collections
 import contextlib
+import functools
 import os
 import shlex
 import shutil
@@ -12,28 +14,69 @@ import tempfile
 from typing import Generator
 from typing import NoReturn
 from typing import Sequence
+from typing import TYPE_CHECKING
 
-from pkg_resources import Requirement
-from pkg_resources import working_set
+if TYPE_CHECKING:
+    from pkg_resources import Distribution
+    from pkg_resources import Requirement
 
 
-installed_things = {pkg.key: pkg for pkg in working_set}
+# comments, and editable installs (which can't be pinned)
+IGNORED_LINE_PREFIXES = ('#', '-e')
+
+GREEN = '\033[32m'
+YELLOW = '\033[33m'
+RED = '\033[31m'
+NORMAL = '\033[m'
+
+# these would leak the calling interpreter's paths into the virtualenv python
+REEXEC_UNSET_ENV = ('PYTHONHOME', 'PYTHONPATH', 'PYTHONSTARTUP')
 
 
 class NeedsMoreInstalledError(RuntimeError):
     pass
 
 
-def color(s: str, color: str) -> str:
-    if sys.stdout.isatty():
-        return '{}{}{}'.format(color, s, '\033[m')
-    else:
+@functools.lru_cache(maxsize=None)
+def _requires(key: str, extras: tuple[str, ...]) -> tuple[Requirement, ...]:
+    """The requirements of the installed `key`, with `extras` sorted.
+
+    Kept until `refresh_installed_things`, as the prod and dev walks in
+    `main` share most of their dependencies.
+    """
+    return tuple(_installed_things()[key].requires(extras))
+
+
+@functools.lru_cache(maxsize=None)
+def _installed_things() -> dict[str, Distribution]:
+    # importing pkg_resources scans every installed distribution, which we
+    # don't need until we're running inside the virtualenv
+    import pkg_resources
+    return {pkg.key: pkg for pkg in pkg_resources.working_set}
+
+
+def refresh_installed_things() -> None:
+    """Rescans the installed distributions, after we've installed more."""
+    from pkg_resources import WorkingSet
+    # `pkg_resources.working_set` was scanned when it was imported, so it
+    # doesn't know about anything we've installed since
+    installed_things = _installed_things()
+    installed_things.clear()
+    installed_things.update((pkg.key, pkg) for pkg in WorkingSet())
+    _requires.cache_clear()
+
+
+if sys.stdout.isatty():
+    def color(s: str, color: str) -> str:
+        return f'{color}{s}{NORMAL}'
+else:
+    def color(s: str, color: str) -> str:
         return s
 
 
 def fmt_cmd(cmd: Sequence[str]) -> str:
     ret = '>>> {}'.format(' '.join(shlex.quote(x) for x in cmd))
-    return color(ret, '\033[32m')
+    return color(ret, GREEN)
 
 
 def print_call(*cmd: str) -> None:
@@ -44,47 +87,80 @@ def print_call(*cmd: str) -> None:
 def reexec(*cmd: str, **kwargs: str) -> NoReturn:
     reason = kwargs.pop('reason')
     assert not kwargs, kwargs
-    print(color(f'*** exec-ing: {reason}', '\033[33m'))
+    print(color(f'*** exec-ing: {reason}', YELLOW))
     print(fmt_cmd(cmd))
+    env = {k: v for k, v in os.environ.items() if k not in REEXEC_UNSET_ENV}
+    # skip scanning the user site-packages, which we'd never use anyway
+    env['PYTHONNOUSERSITE'] = '1'
     # Never returns
-    os.execv(cmd[0], cmd)
+    os.execve(cmd[0], cmd, env)
 
 
 def requirements(
         requirements_filename: str,
 ) -> Generator[Requirement, None, None]:
+    from pkg_resources import parse_requirements
+
     with open(requirements_filename) as requirements_file:
-        for line in requirements_file:
-            if line.strip() and not line.startswith(('#', '-e')):
-                yield Requirement.parse(line.strip())
+        lines = requirements_file.read().splitlines()
+    return parse_requirements(
+        line for line in lines
+        if line.strip() and not line.startswith(IGNORED_LINE_PREFIXES)
+    )
 
 
-def installed(requirements_file: str) -> set[str]:
-    expected_pinned = set()
-    requirements_to_parse = list(requirements(requirements_file))
-    already_parsed = {(req.key, req.extras) for req in requirements_to_parse}
+def installed(requirements_file: str) -> list[str]:
+    installed_things = _installed_things()
+    # key => (project name, version), formatted once we're done walking
+    expected_pinned: dict[str, tuple[str, str]] = {}
+    requirements_to_parse = collections.deque(requirements(requirements_file))
+    # a package pulled in with extras has to be walked again for what those
+    # extras add, so it is tracked as (key, extras); the dependencies of the
+    # minimal requirements rarely ask for extras, so the rest are keyed by
+    # name alone
+    already_parsed: set[str | tuple[str, tuple[str, ...]]] = {
+        (req.key, req.extras) if req.extras else req.key
+        for req in requirements_to_parse
+    }
     unmet = set()
 
     while requirements_to_parse:
-        req = requirements_to_parse.pop()
-        installed_req = installed_things[req.key]
-        expected_pinned.add(
-            f'{installed_req.project_name}=={installed_req.version}',
+        req = requirements_to_parse.popleft()
+        key = req.key
+        installed_req = installed_things[key]
+        expected_pinned[key] = (
+            installed_req.project_name, installed_req.version,
         )
-        for sub in installed_req.requires(req.extras):
-            if sub.key not in installed_things:
+        for sub in _requires(key, tuple(sorted(req.extras))):
+            sub_key = sub.key
+            if sub_key not in installed_things:
                 specifiers = ','.join(
                     str(s) for s in sub.specifier  # type: ignore[attr-defined]
                 )
-                unmet.add(f'{sub.key}{specifiers}')
-            elif (sub.key, sub.extras) not in already_parsed:
+                unmet.add(f'{sub_key}{specifiers}')
+                continue
+            sub_extras = sub.extras
+            ident: str | tuple[str, tuple[str, ...]]
+            ident = (sub_key, sub_extras) if sub_extras else sub_key
+            if ident not in already_parsed:
                 requirements_to_parse.append(sub)
-                already_parsed.add((sub.key, sub.extras))
+                already_parsed.add(ident)
 
     if unmet:
         raise NeedsMoreInstalledError(unmet)
     else:
-        return expected_pinned
+        return sorted(
+            (
+                f'{name}=={version}'
+                for name, version in expected_pinned.values()
+            ),
+            key=requirement_sort_key,
+        )
+
+
+def requirement_sort_key(requirement: str) -> str:
+    """Orders pins by name, the same way as `requirements-txt-fixer`."""
+    return requirement.partition('==')[0].lower()
 
 
 def venv_paths(tmp: str, pip_tool: str) -> tuple[str, ...]:
@@ -133,8 +209,7 @@ def make_virtualenv(args: argparse.Namespace) -> NoReturn:
             python, __file__.rstrip('c'),
             '--tempdir', tempdir,
             # Pass along existing args
-            '--exec-count', str(args.exec_count),
-            '--exec-limit', str(args.exec_limit),
+            '--install-limit', str(args.install_limit),
             '--pip-tool', args.pip_tool,
             f'--install-deps={args.install_deps}',
         ]
@@ -153,10 +228,7 @@ def main() -> int:
     )
     parser.add_argument('-i', '--index-url')
     parser.add_argument(
-        '--exec-limit', type=int, default=10, help=argparse.SUPPRESS,
-    )
-    parser.add_argument(
-        '--exec-count', type=int, default=0, help=argparse.SUPPRESS,
+        '--install-limit', type=int, default=10, help=argparse.SUPPRESS,
     )
     parser.add_argument('--tempdir', help=argparse.SUPPRESS)
     parser.add_argument('--pip-tool', default='pip')
@@ -169,59 +241,45 @@ def main() -> int:
     if args.tempdir is None:
         make_virtualenv(args)  # Never returns
 
-    venv, python, pip, pip_tool_path = venv_paths(args.tempdir, args.pip_tool)
+    _, _, _, pip_tool_path = venv_paths(args.tempdir, args.pip_tool)
     pip_tool = tuple(shlex.split(pip_tool_path))
 
     with cleanup_dir(args.tempdir):
-        try:
-            reqs = installed('requirements-minimal.txt')
-            reqs_dev = installed('requirements-dev-minimal.txt')
-        except NeedsMoreInstalledError as e:
-            print(color('Installing unmet requirements!', '\033[31m'))
-            print('Probably due to https://github.com/pypa/pip/issues/3903')
-            new_exec_count = args.exec_count + 1
-            if new_exec_count > args.exec_limit:
-                raise AssertionError('--exec-limit depth limit exceeded')
-            unmet, = e.args
-
-            install: tuple[str, ...] = ('install',)
-            if args.index_url:
-                install = ('install', '-i', args.index_url)
-            print_call(*(pip_tool + install + tuple(unmet)))
-
-            reexec_args = [
-                python, __file__.rstrip('c'),
-                '--exec-count', str(new_exec_count),
-                # Pass along existing args
-                '--tempdir', args.tempdir,
-                '--exec-limit', str(args.exec_limit),
-            ]
-
-            if args.index_url:
-                reexec_args.extend(('--index-url', args.index_url))
-
-            reexec(*reexec_args, reason='Unmet dependencies')
-
-        def _file_contents(reqs: set[str]) -> str:
-            if not reqs:
-                return ''
+        install_rounds = 0
+        while True:
+            try:
+                reqs = installed('requirements-minimal.txt')
+                reqs_dev = installed('requirements-dev-minimal.txt')
+            except NeedsMoreInstalledError as e:
+                print(color('Installing unmet requirements!', RED))
+                print(
+                    'Probably due to https://github.com/pypa/pip/issues/3903',
+                )
+                install_rounds += 1
+                if install_rounds > args.install_limit:
+                    raise AssertionError(
+                        '--install-limit rounds of installing unmet '
+                        'requirements exceeded',
+                    )
+                unmet, = e.args
+
+                install: tuple[str, ...] = ('install',)
+                if args.index_url:
+                    install = ('install', '-i', args.index_url)
+                print_call(*(pip_tool + install + tuple(unmet)))
+
+                # pick up what we just installed without re-exec-ing
+                refresh_installed_things()
             else:
-                return '\n'.join(reqs) + '\n'
+                break
 
         with open('requirements.txt', 'w') as f:
-            f.write(_file_contents(reqs))
+            f.writelines(f'{req}\n' for req in reqs)
+        prod_pins = frozenset(reqs)
         with open('requirements-dev.txt', 'w') as f:
-            f.write(_file_contents(reqs_dev - reqs))
-
-        with open(os.devnull, 'w') as devnull:
-            subprocess.check_call(
-                pip_tool + ('install', 'pre-commit-hooks'),
-                stdout=devnull, stderr=devnull,
+            f.writelines(
+                f'{req}\n' for req in reqs_dev if req not in prod_pins
             )
-        subprocess.call((
-            os.path.join(venv, 'bin', 'requirements-txt-fixer'),
-            'requirements.txt', 'requirements-dev.txt',
-        ))
     return 0
 
 
@@ -2,24 +2,40 @@
 from __future__ import annotations
 
 import argparse
+import functools
 import sys
 from typing import Generator
+from typing import TYPE_CHECKING
 
-import pkg_resources
-from pkg_resources import Requirement
+if TYPE_CHECKING:
+    from pkg_resources import Distribution
+    from pkg_resources import Requirement
 
 
-color = sys.stdout.isatty()
-reqs = {pkg.key: pkg for pkg in pkg_resources.working_set}
+UNMET_COLOR = '\033[41m'
+NORMAL_COLOR = '\033[m'
+if sys.stdout.isatty():
+    UNMET = f' {UNMET_COLOR}(UNMET!){NORMAL_COLOR}'
+else:
+    UNMET = ' (UNMET!)'
+
+
+@functools.lru_cache(maxsize=None)
+def _installed_things() -> dict[str, Distribution]:
+    # importing pkg_resources scans every installed distribution, so put it
+    # off until we need it (`--help` doesn't)
+    import pkg_resources
+    return {pkg.key: pkg for pkg in pkg_resources.working_set}
 
 
 def get_lines_from_file(filename: str) -> list[str]:
     """Returns the non-blank, non-comment lines from a requirements file."""
     with open(filename, encoding='UTF-8') as requirements_file:
-        return [
-            line.strip() for line in requirements_file
-            if line.strip() and not line.startswith('#')
-        ]
+        lines = requirements_file.read().splitlines()
+    return [
+        line.strip() for line in lines
+        if line.strip() and not line.startswith('#')
+    ]
 
 
 def get_raw_requirements(
@@ -28,48 +44,69 @@ def get_raw_requirements(
     """Get requirements from a requirements.txt file.  -r is not supported"""
     unparsed_requirements_lines = get_lines_from_file(requirements_file)
 
+    import pkg_resources
+
     return pkg_resources.parse_requirements(
         '\n'.join(unparsed_requirements_lines),
     )
 
 
-def print_req(
-        req: Requirement,
-        depth: int,
-        seen: tuple[str, ...] = (),
-) -> None:
-    if req.key in seen:
-        circular = ' (circular: {})'.format(
-            '->'.join(seen[seen.index(req.key):] + (req.key,)),
+@functools.lru_cache(maxsize=None)
+def _children(key: str, extras: tuple[str, ...]) -> tuple[Requirement, ...]:
+    """The requirements of the installed `key`, in the order they're printed.
+
+    A package shared by several parents is printed under each of them, so
+    this is cached to only read its metadata once.  `extras` is left in the
+    order it was written, as it decides the order of the children.
+    """
+    return tuple(_installed_things()[key].requires(extras))
+
+
+def print_req(req: Requirement, depth: int = 0) -> None:
+    """Prints `req` and, depth first, everything it depends on."""
+    installed_things = _installed_things()
+    # keys of the requirements between `req` and the one being printed
+    path: list[str] = []
+    on_path: set[str] = set()
+    # `None` marks the point where we are done with the children of path[-1]
+    stack: list[Requirement | None] = [req]
+    while stack:
+        current = stack.pop()
+        if current is None:
+            on_path.remove(path.pop())
+            continue
+
+        if current.key in on_path:
+            cycle = path[path.index(current.key):] + [current.key]
+            circular = ' (circular: {})'.format('->'.join(cycle))
+        else:
+            circular = ''
+
+        if current.key not in installed_things:
+            unmet = UNMET
+        else:
+            unmet = ''
+
+        current_depth = depth + len(path)
+        print(
+            '{} {}{}{}{}{}'.format(
+                '  ' * current_depth + bool(current_depth) * ' -',
+                current.key,
+                '[{}]'.format(','.join(current.extras))
+                if current.extras else '',
+                ','.join(''.join(spec) for spec in current.specs),
+                circular,
+                unmet,
+            ),
         )
-    else:
-        circular = ''
-
-    if req.key not in reqs:
-        unmet = ' {}{}{}'.format(
-            '\033[41m' if color else '',
-            '(UNMET!)',
-            '\033[m' if color else '',
-        )
-    else:
-        unmet = ''
-
-    print(
-        '{} {}{}{}{}{}'.format(
-            '  ' * depth + bool(depth) * ' -',
-            req.key,
-            '[{}]'.format(','.join(req.extras)) if req.extras else '',
-            ','.join(''.join(spec) for spec in req.specs),
-            circular,
-            unmet,
-        ),
-    )
 
-    if circular or unmet:
-        return
+        if circular or unmet:
+            continue
 
-    for sub_requirement in reqs[req.key].requires(req.extras):
-        print_req(sub_requirement, depth + 1, seen=seen + (req.key,))
+        path.append(current.key)
+        on_path.add(current.key)
+        stack.append(None)
+        stack.extend(reversed(_children(current.key, current.extras)))
 
 
 def main() -> int:
@@ -79,7 +116,7 @@ def main() -> int:
 
     raw_requirements = get_raw_requirements(args.requirements_file)
     for requirement in raw_requirements:
-        print_req(requirement, 0)
+        print_req(requirement)
     return 0
 
 
@@ -15,13 +15,11 @@ ALL_PACKAGES = (
 
 
 def main():
-    for pkg in ALL_PACKAGES:
-        with open(os.devnull, 'w') as devnull:
-            subprocess.call(
-                (sys.executable, '-m', 'pip', 'uninstall', '-y', pkg),
-                stdout=devnull,
-                stderr=devnull,
-            )
+    subprocess.call(
+        (sys.executable, '-m', 'pip', 'uninstall', '-y') + ALL_PACKAGES,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
     subprocess.check_output(
         # We'll manage dependencies manually
         (sys.executable, '-m', 'pip', 'install', '--no-deps') +
@@ -0,0 +1,66 @@
+import pkg_resources
+import pytest
+
+
+@pytest.fixture
+def in_tmpdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def write_reqs(in_tmpdir):
+    """Writes requirements files into the temporary directory, given a
+    mapping of filename to contents.
+    """
+    def _write_reqs(files):
+        for filename, contents in files.items():
+            (in_tmpdir / filename).write_text(contents)
+    return _write_reqs
+
+
+@pytest.fixture(scope='session')
+def empty_requirements_file(tmp_path_factory):
+    """An empty requirements.txt, shared by the tests which only read it."""
+    path = tmp_path_factory.mktemp('empty') / 'requirements.txt'
+    path.touch()
+    return str(path)
+
+
+@pytest.fixture
+def site(tmp_path_factory, monkeypatch):
+    """An empty directory of installed distributions, on `sys.path`."""
+    site = tmp_path_factory.mktemp('site')
+    monkeypatch.syspath_prepend(str(site))
+    return site
+
+
+@pytest.fixture
+def make_dist(site):
+    """Installs a fake distribution into `site`."""
+    def _make_dist(name, version, requires=(), extras=()):
+        dist_info = site / f'{name.replace("-", "_")}-{version}.dist-info'
+        dist_info.mkdir()
+        (dist_info / 'METADATA').write_text(
+            'Metadata-Version: 2.1\n'
+            'Name: {}\n'
+            'Version: {}\n'
+            '{}{}'.format(
+                name, version,
+                ''.join(f'Provides-Extra: {extra}\n' for extra in extras),
+                ''.join(f'Requires-Dist: {req}\n' for req in requires),
+            ),
+        )
+    return _make_dist
+
+
+@pytest.fixture
+def scan_site(site, monkeypatch):
+    """Replaces `pkg_resources.working_set` with what importing
+    pkg_resources would find now that `site` is populated.
+    """
+    def _scan_site():
+        monkeypatch.setattr(
+            pkg_resources, 'working_set', pkg_resources.WorkingSet(),
+        )
+    return _scan_site
@@ -0,0 +1,72 @@
+import sys
+
+import pytest
+
+from requirements_tools import upgrade_requirements as main
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    yield
+    main._installed_things.cache_clear()
+    main._requires.cache_clear()
+
+
+@pytest.fixture
+def run_upgrade(write_reqs, scan_site, tmp_path_factory, monkeypatch):
+    """Runs `main` as if inside the virtualenv, passing what it would
+    `pip install` to `install` instead.
+    """
+    def _run_upgrade(install, *argv):
+        tempdir = str(tmp_path_factory.mktemp('tmp'))
+
+        def print_call(*cmd):
+            assert cmd[:2] == (f'{tempdir}/venv/bin/pip', 'install')
+            install(*cmd[2:])
+
+        monkeypatch.setattr(main, 'print_call', print_call)
+        monkeypatch.setattr(
+            sys, 'argv', ['upgrade-requirements', '--tempdir', tempdir, *argv],
+        )
+        scan_site()
+        return main.main()
+    return _run_upgrade
+
+
+def test_main_installs_unmet_requirements(
+        write_reqs, make_dist, run_upgrade,
+):
+    write_reqs({
+        'requirements-minimal.txt': 'top-pkg',
+        'requirements-dev-minimal.txt': 'dev-pkg',
+    })
+    make_dist('top-pkg', '1.0', ('new-pkg',))
+    make_dist('dev-pkg', '3.0', ('top-pkg',))
+    installs = []
+
+    def install(*reqs):
+        installs.append(reqs)
+        make_dist('new-pkg', '2.0')
+
+    assert run_upgrade(install) == 0
+    assert installs == [('new-pkg',)]
+    with open('requirements.txt') as f:
+        assert f.read() == 'new-pkg==2.0\ntop-pkg==1.0\n'
+    with open('requirements-dev.txt') as f:
+        assert f.read() == 'dev-pkg==3.0\n'
+
+
+def test_main_install_limit(write_reqs, make_dist, run_upgrade):
+    write_reqs({
+        'requirements-minimal.txt': 'top-pkg',
+        'requirements-dev-minimal.txt': '',
+    })
+    make_dist('top-pkg', '1.0', ('new-pkg',))
+    installs = []
+
+    with pytest.raises(AssertionError) as excinfo:
+        run_upgrade(installs.append, '--install-limit', '1')
+    assert excinfo.value.args == (
+        '--install-limit rounds of installing unmet requirements exceeded',
+    )
+    assert installs == ['new-pkg']
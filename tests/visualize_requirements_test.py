@@ -0,0 +1,61 @@
+import sys
+
+import pytest
+
+from requirements_tools import visualize_requirements as main
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    yield
+    main._installed_things.cache_clear()
+    main._children.cache_clear()
+
+
+@pytest.fixture
+def visualize(in_tmpdir, scan_site, monkeypatch, capsys):
+    """Runs `main` on a requirements file, returning the printed lines."""
+    def _visualize(requirements):
+        (in_tmpdir / 'requirements.txt').write_text(requirements)
+        monkeypatch.setattr(
+            sys, 'argv', ['visualize-requirements', 'requirements.txt'],
+        )
+        scan_site()
+        assert main.main() == 0
+        out, _ = capsys.readouterr()
+        return out.splitlines()
+    return _visualize
+
+
+def test_nested(make_dist, visualize):
+    make_dist('a', '1.0', ('b>=1', 'c[x]'))
+    make_dist('b', '1.0', ('d',))
+    make_dist('c', '1.0', ('d', 'e; extra == "x"'), extras=('x',))
+    make_dist('d', '1.0')
+    make_dist('e', '1.0')
+    assert visualize('a==1.0\nd\n') == [
+        ' a==1.0',
+        '   - b>=1',
+        '     - d',
+        '   - c[x]',
+        '     - d',
+        '     - e',
+        ' d',
+    ]
+
+
+def test_circular(make_dist, visualize):
+    make_dist('a', '1.0', ('b',))
+    make_dist('b', '1.0', ('c',))
+    make_dist('c', '1.0', ('b',))
+    assert visualize('a\n') == [
+        ' a',
+        '   - b',
+        '     - c',
+        '       - b (circular: b->c->b)',
+    ]
+
+
+def test_unmet(make_dist, visualize):
+    make_dist('a', '1.0', ('missing',))
+    assert visualize('a\n') == [' a', '   - missing (UNMET!)']